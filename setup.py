@@ -24,7 +24,8 @@ setuptools.setup(
     install_requires=[
         'echome-sdk==0.5.1',
         'requests>=2.24',
-        'tabulate>=0.8.7'
+        'tabulate>=0.8.7',
+        'importlib-metadata>=1.0; python_version < "3.8"'
     ],
     entry_points = {
         'console_scripts': [
@@ -1,11 +1,29 @@
 import sys
 import argparse
+import csv
 import json
-import operator
-from functools import reduce
 from tabulate import tabulate
 from echome.session import Session
+from echome.exceptions import UnauthorizedResponse
 from .defaults import APP_NAME, DEFAULT_FORMAT
+from . import records
+from .records import RecordTable, get_row_values
+from . import streaming
+from . import recording
+
+_session = None
+
+
+def get_session():
+    """Return the Session shared by every service in this process, creating it on first use"""
+    global _session
+    if _session is None:
+        if recording.is_replaying():
+            # Responses come from the recording, so skip logging in and the configured server
+            _session = Session(server="replay.local", login=False)
+        else:
+            _session = Session()
+    return _session
 
 
 class BaseService:
@@ -16,8 +34,8 @@ class BaseService:
 
     output_flag_args = ["--output", "-o"]
     output_flag_kwargs = {
-        'help': 'Output format as JSON or Table',
-        'choices': ["table", "json"],
+        'help': 'Output format as Table, JSON, JSON lines or CSV',
+        'choices': ["table", "json", "jsonl", "csv"],
         'default': DEFAULT_FORMAT
     }
 
@@ -83,6 +101,10 @@ class BaseService:
             "print_table",
             "print_output",
             "get_from_nested_list",
+            "to_records",
+            "print_csv",
+            "print_json_array",
+            "stream_results",
         ] + self.exclusions
 
         methods = []
@@ -92,20 +114,20 @@ class BaseService:
 
         return methods
     
-    @staticmethod
-    def get_from_dict(dict, mapList):
-        """Traverse a dictionary to get a nested value from a list """
-        return reduce(operator.getitem, mapList, dict)
-    
+    get_from_dict = staticmethod(records.get_from_dict)
+    get_from_nested_list = staticmethod(records.get_from_nested_list)
 
-    @staticmethod
-    def get_from_nested_list(dictionary, keys):
-        items = []
-        for val in dictionary[keys[0]]:
-            if val:
-                items.append(val[keys[1]])
 
-        return ",".join(items)
+    def to_records(self, objlist, header=None, data_columns=None, wide:bool=False):
+        """
+        Keep only the columns needed to print a table of objlist.
+
+        Listing commands call this as soon as they have the API results and drop their
+        reference to the results, so the full response is not held in memory while the
+        table is rendered. Header and data columns default to the same values as print_table.
+        """
+        header, data_columns = self._get_columns(header, data_columns, wide)
+        return RecordTable(objlist, header, data_columns)
 
 
     def print_table(self, objlist, header=None, data_columns=None, wide:bool=False):
@@ -116,44 +138,82 @@ class BaseService:
         should set __init__ variables: self.table_headers, self.data_columns with information for 
         that resource. But they can be overwritten by setting parameters.
         Nested dictionary items should be a list, e.g. '[dict_key1, ["dict_key2", "nested_key1"], dict_key3]'
+        Columns derived from other values should be a records.Computed.
+        objlist can also be a RecordTable returned by to_records().
         """
-        if not header:
-            header = self.table_headers + self.extra_table_headers if wide else self.table_headers
-        
-        if not data_columns:
-            data_columns = self.data_columns + self.extra_data_columns if wide else self.data_columns
-        
-        all_rows = []
+        if not isinstance(objlist, RecordTable):
+            objlist = self.to_records(objlist, header, data_columns, wide)
+
+        print(tabulate(objlist, objlist.header))
+
+
+    def print_csv(self, objlist, header=None, data_columns=None, wide:bool=False):
+        """Print the table columns as CSV, one row at a time"""
+        header, data_columns = self._get_columns(header, data_columns, wide)
+
+        writer = csv.writer(sys.stdout)
+        writer.writerow(header)
         for row in objlist:
-            formatted_row = []
-            for col in data_columns:
-                if isinstance(col, list):
-                    try:
-                        res = self.get_from_dict(row, col)
-                    except TypeError:
-                        try:
-                            res = self.get_from_nested_list(row, col)
-                        except Exception:
-                            res = ""
-                    except KeyError:
-                        res = ""
-                    
-                else:
-                    res = row[col]
-                formatted_row.append(res)
-
-            all_rows.append(formatted_row)
-
-        print(tabulate(all_rows, header))
+            writer.writerow(get_row_values(row, data_columns))
+
+
+    @staticmethod
+    def print_json_array(objlist):
+        """Print an iterable of items with the same formatting as json.dumps(list, indent=4), one item at a time"""
+        first = True
+        for item in objlist:
+            item_json = json.dumps(item, indent=4).replace("\n", "\n    ")
+            print(f"[\n    {item_json}" if first else f",\n    {item_json}", end="")
+            first = False
+        print("[]" if first else "\n]")
     
 
-    def print_output(self, output, format, func = None, wide:bool = False):
-        """Prints the output based on the provided format"""
+    def print_output(self, output, format, func = None, wide:bool = False, header=None, data_columns=None):
+        """
+        Prints the output based on the provided format
 
-        if func == None:
-            func = self.print_table
+        output can be a list or an iterator of results from stream_results(). header and data_columns
+        are used for table and CSV output, falling back to the service's table columns.
+        """
 
         if format == "table":
-            func(output, wide=wide)
+            if func == None:
+                self.print_table(output, header, data_columns, wide=wide)
+            else:
+                func(output, wide=wide)
         elif format == "json":
-            print(json.dumps(output, indent=4))
+            if hasattr(output, "__next__"):
+                self.print_json_array(output)
+            else:
+                print(json.dumps(output, indent=4))
+        elif format == "jsonl":
+            for item in [output] if isinstance(output, dict) else output:
+                print(json.dumps(item))
+        elif format == "csv":
+            self.print_csv([output] if isinstance(output, dict) else output, header, data_columns, wide)
+
+
+    def stream_results(self, method:str):
+        """
+        Return an iterator over the results of one of this service's client listing methods, e.g. 'describe_all_vms'.
+
+        A rejected request or failed login prints the reason and exits.
+        """
+        try:
+            return streaming.stream_results(self.client, method)
+        except streaming.BadRequestError as error:
+            print(error)
+            exit(1)
+        except UnauthorizedResponse as error:
+            print(f"Unable to authorize with the ecHome server: {error}")
+            exit(1)
+
+
+    def _get_columns(self, header=None, data_columns=None, wide:bool=False):
+        if not header:
+            header = self.table_headers + self.extra_table_headers if wide else self.table_headers
+        
+        if not data_columns:
+            data_columns = self.data_columns + self.extra_data_columns if wide else self.data_columns
+
+        return header, data_columns
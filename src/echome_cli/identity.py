@@ -1,10 +1,12 @@
 import sys
 import argparse
+import csv
 import json
-from echome import Session
+from getpass import getpass
 from echome.identity import Identity
-from .base_service import BaseService
+from .base_service import BaseService, get_session
 from .defaults import APP_NAME
+from .utils import run_concurrently
 
 class IdentityService(BaseService):
     
@@ -17,7 +19,7 @@ class IdentityService(BaseService):
         self.table_headers = ["Username", "First Name", "Last Name", "User ID", "Active", "Created"]
         self.data_columns=["username", "first_name", "last_name", "user_id", "is_active", "created"]
 
-        self.session = Session()
+        self.session = get_session()
         self.client:Identity = self.session.client("Identity")
 
         self.parent_service_argparse()
@@ -41,8 +43,11 @@ class IdentityService(BaseService):
         parser.add_argument(*self.output_flag_args, **self.output_flag_kwargs)
         args = parser.parse_args(sys.argv[3:])
 
-        users = self.client.describe_all_users()
-        self.print_output(users["results"], args.output)
+        users = self.client.describe_all_users()["results"]
+        if args.output == "table":
+            users = self.to_records(users)
+
+        self.print_output(users, args.output)
         
         #TODO: Return exit value if command does not work
         exit()
@@ -64,7 +69,7 @@ class IdentityService(BaseService):
         parser = argparse.ArgumentParser(description='Create user or API keys', prog=f"{APP_NAME} {self.parent_service} create-user")
         parser.add_argument('--username', help='Username. This will be used for login.', required=True, metavar="<value>", dest="Username")
         parser.add_argument('--email', help='Email address of the user.', required=False, metavar="<value>", dest="Email")
-        parser.add_argument('--name', help='Name of the user', required=False, metavar="<value>", dest="InstanceSize")
+        parser.add_argument('--name', help='Name of the user', required=False, metavar="<value>", dest="Name")
 
         group = parser.add_mutually_exclusive_group(required=True)
         group.add_argument('--password', help='Password for the user. If this is not supplied, the script will prompt you to\
@@ -75,7 +80,12 @@ class IdentityService(BaseService):
         parser.add_argument('--tags', help='Tags', type=json.loads, metavar='{"Key": "Value", "Key": "Value"}', dest="Tags")
         args = parser.parse_args(sys.argv[3:])
 
-        print(self.client.create(**vars(args)))
+        items = vars(args)
+        items.pop("no_password")
+        if items["Password"] is None:
+            items.pop("Password")
+
+        print(self.client.create_user(**items))
         
         #TODO: Return exit value if command does not work
         exit()
@@ -83,10 +93,166 @@ class IdentityService(BaseService):
 
     def delete_user(self):
         parser = argparse.ArgumentParser(description="Delete a user or a user's API keys", prog=f"{APP_NAME} {self.parent_service} delete-user")
+        parser.add_argument('user_id',  help='User id', metavar="<user-id>")
         args = parser.parse_args(sys.argv[3:])
 
-        results = self.client.delete()
+        results = self.client.delete_user(args.user_id)
         self.print_output(results, "json")
         
         #TODO: Return exit value if command does not work
         exit()
+
+
+    def import_users(self):
+        parser = argparse.ArgumentParser(description='Create users in bulk from a CSV file', prog=f"{APP_NAME} {self.parent_service} import-users")
+        parser.add_argument('-f', '--file', help='CSV file with a header row. Columns: username (required), email, name, password, tags (JSON).', required=True, metavar="<users.csv>")
+        group = parser.add_mutually_exclusive_group()
+        group.add_argument('--password', help='Password for rows without a password column. If neither this nor --no-password is supplied, \
+            you will be prompted once for a password used for all of those rows.', metavar="<value>")
+        group.add_argument('--no-password',  help='Rows without a password column will have one generated for them.', action='store_true')
+        parser.add_argument('--dry-run', help='Only show which users would be created.', action='store_true')
+        args = parser.parse_args(sys.argv[3:])
+
+        try:
+            with open(args.file, newline="") as file_object:
+                rows = list(csv.DictReader(file_object))
+        except OSError as error:
+            print(error)
+            exit(1)
+
+        existing = {user["username"] for user in self.client.describe_all_users()["results"]}
+
+        results = []
+        to_create = []
+        for row in rows:
+            username = (row.get("username") or "").strip()
+            result = {"username": username, "status": "", "details": ""}
+            results.append(result)
+            if not username:
+                result["status"] = "invalid"
+                result["details"] = "Missing username"
+            elif username in existing:
+                result["status"] = "exists"
+            else:
+                # Validate every row up front so a dry run reports the same problems as a real run
+                try:
+                    request = self._build_user_request(row)
+                except ValueError as error:
+                    result["status"] = "invalid"
+                    result["details"] = str(error)
+                    continue
+                result["status"] = "would create" if args.dry_run else "pending"
+                existing.add(username)
+                to_create.append((request, result))
+
+        if not args.dry_run and to_create:
+            password = args.password
+            needs_password = any("Password" not in request for request, _ in to_create)
+            if needs_password and password is None and not args.no_password:
+                password = getpass("Password for imported users: ")
+
+            if password:
+                for request, _ in to_create:
+                    request.setdefault("Password", password)
+
+            responses = run_concurrently(lambda item: self.client.create_user(**item[0]), to_create)
+            for (_, result), response, error in responses:
+                self._record_result(result, response, error, "created")
+
+        self.print_table(results, ["Username", "Status", "Details"], ["username", "status", "details"])
+
+        if any(result["status"] in ["failed", "invalid"] for result in results):
+            exit(1)
+        exit()
+
+
+    def delete_users(self):
+        parser = argparse.ArgumentParser(description='Delete users in bulk', prog=f"{APP_NAME} {self.parent_service} delete-users")
+        parser.add_argument('users',  help='Usernames or user ids to delete', nargs="*", metavar="<username>")
+        parser.add_argument('-f', '--file', help='CSV file with a header row containing a username or user_id column.', metavar="<users.csv>")
+        parser.add_argument('--dry-run', help='Only show which users would be deleted.', action='store_true')
+        args = parser.parse_args(sys.argv[3:])
+
+        names = list(args.users)
+        if args.file:
+            try:
+                with open(args.file, newline="") as file_object:
+                    for row in csv.DictReader(file_object):
+                        name = row.get("user_id") or row.get("username")
+                        if name:
+                            names.append(name.strip())
+            except OSError as error:
+                print(error)
+                exit(1)
+
+        if not names:
+            parser.error("No users supplied. Pass usernames or use --file.")
+
+        user_ids = {}
+        for user in self.client.describe_all_users()["results"]:
+            user_ids[user["username"]] = user["user_id"]
+            user_ids[user["user_id"]] = user["user_id"]
+
+        results = []
+        to_delete = []
+        seen = {}
+        for name in names:
+            result = {"username": name, "status": "", "details": ""}
+            results.append(result)
+            if name not in user_ids:
+                result["status"] = "not found"
+                continue
+
+            user_id = user_ids[name]
+            result["details"] = user_id
+            # The same user may be given by both username and user id
+            if user_id in seen:
+                result["status"] = f"duplicate of {seen[user_id]}"
+            else:
+                seen[user_id] = name
+                result["status"] = "would delete" if args.dry_run else "pending"
+                to_delete.append((user_id, result))
+
+        if not args.dry_run:
+            responses = run_concurrently(lambda item: self.client.delete_user(item[0]), to_delete)
+            for (_, result), response, error in responses:
+                self._record_result(result, response, error, "deleted")
+
+        self.print_table(results, ["User", "Status", "Details"], ["username", "status", "details"])
+
+        if any(result["status"] in ["failed", "not found"] for result in results):
+            exit(1)
+        exit()
+
+
+    @staticmethod
+    def _build_user_request(row:dict):
+        """Build the keyword arguments for create_user from a CSV row. Raises ValueError if the row is invalid."""
+        request = {"Username": row["username"].strip()}
+        if row.get("email"):
+            request["Email"] = row["email"].strip()
+        if row.get("name"):
+            request["Name"] = row["name"].strip()
+
+        if row.get("password"):
+            request["Password"] = row["password"]
+
+        if row.get("tags"):
+            try:
+                request["Tags"] = json.loads(row["tags"])
+            except json.JSONDecodeError:
+                raise ValueError("Tags column is not valid JSON")
+        return request
+
+
+    @staticmethod
+    def _record_result(result:dict, response, error, status:str):
+        """Update a per-row result from an API response or exception"""
+        if error is not None:
+            result["status"] = "failed"
+            result["details"] = str(error)
+        elif isinstance(response, dict) and response.get("success") == False:
+            result["status"] = "failed"
+            result["details"] = response.get("details", "")
+        else:
+            result["status"] = status
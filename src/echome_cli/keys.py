@@ -1,10 +1,50 @@
+import os
 import sys
 import argparse
 import json
-from echome import Session
+import base64
+import binascii
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
 from echome.keys import Keys
-from .base_service import BaseService
+from .base_service import BaseService, get_session
 from .defaults import APP_NAME
+from .utils import write_file_atomic, run_concurrently
+
+KEY_TYPE_PREFIXES = ("ssh-", "ecdsa-", "sk-")
+
+
+def parse_public_key(line:str):
+    """
+    Parse a single authorized_keys style line.
+
+    Returns a tuple of (key_type, key_data, comment), or None if the line does not contain a key.
+    Leading options (e.g. 'no-pty,command="..."') are skipped.
+    """
+    line = line.strip()
+    if not line or line.startswith("#"):
+        return None
+
+    tokens = line.split()
+    for i, token in enumerate(tokens[:-1]):
+        if token.startswith(KEY_TYPE_PREFIXES):
+            return token, tokens[i + 1], " ".join(tokens[i + 2:])
+    return None
+
+
+def compute_fingerprint(public_key:str):
+    """Return the MD5 fingerprint of a public key in the format used by the ecHome server, or None if it is invalid."""
+    parsed = parse_public_key(public_key)
+    if parsed is None:
+        return None
+    try:
+        blob = base64.b64decode(parsed[1], validate=True)
+    except (binascii.Error, ValueError):
+        return None
+
+    digest = hashlib.md5(blob).hexdigest()
+    return "MD5:" + ":".join(digest[i:i + 2] for i in range(0, len(digest), 2))
+
 
 class KeysService(BaseService):
 
@@ -20,7 +60,7 @@ class KeysService(BaseService):
         self.extra_table_headers = ["Created"]
         self.extra_data_columns = ["created"]
 
-        self.session = Session()
+        self.session = get_session()
         self.client:Keys = self.session.client("Keys")
 
         self.parent_service_argparse()
@@ -32,8 +72,11 @@ class KeysService(BaseService):
         parser.add_argument(*self.wide_flag_args, **self.wide_flags_kwargs)
         args = parser.parse_args(sys.argv[3:])
         
-        contents = self.client.describe_all_sshkeys()
-        self.print_output(contents['results'], args.output, wide=args.wide)
+        contents = self.client.describe_all_sshkeys()['results']
+        if args.output == "table":
+            contents = self.to_records(contents, wide=args.wide)
+
+        self.print_output(contents, args.output, wide=args.wide)
         
         exit()
     
@@ -61,6 +104,11 @@ class KeysService(BaseService):
 
         args = parser.parse_args(sys.argv[3:])
 
+        # The private key is only returned once, so check the destination before creating the key
+        if args.file and os.path.exists(args.file):
+            print(f"File {args.file} already exists, refusing to overwrite it with the private key.")
+            exit(1)
+
         response = self.client.create_sshkey(args.key_name)
         if response["success"] == False:
            print(response)
@@ -71,12 +119,12 @@ class KeysService(BaseService):
             exit(0)
         else:
             try:
-                with open(args.file, "a") as file_object:
-                    # Append 'hello' at the end of file
-                    file_object.write(response["PrivateKey"])
-                    response["PrivateKey"] = args.file
+                write_file_atomic(args.file, response["PrivateKey"], 0o600, overwrite=False)
+                response["PrivateKey"] = args.file
             except Exception as error:
+                # Print the key instead so it is not lost
                 print(error)
+                print(json.dumps(response, indent=4))
                 exit(1)
 
         print(json.dumps(response, indent=4))
@@ -92,3 +140,117 @@ class KeysService(BaseService):
         print(json.dumps(self.client.delete(args.key_name), indent=4))
         #TODO: Return exit value if command does not work
         exit()
+
+
+    def import_keys(self):
+        parser = argparse.ArgumentParser(description='Import SSH public keys from a directory of .pub files or an authorized_keys file', prog=f"{APP_NAME} {self.parent_service} import-keys")
+        parser.add_argument('path',  help='Directory containing .pub files or an authorized_keys style file', metavar="<path>")
+        parser.add_argument('--tags', help='Tags added to every imported key', type=json.loads, metavar='{"Key": "Value", "Key": "Value"}', dest="Tags")
+        parser.add_argument('--dry-run', help='Only report which keys would be imported.', action='store_true')
+        args = parser.parse_args(sys.argv[3:])
+
+        try:
+            keys = self._read_public_keys(args.path)
+        except OSError as error:
+            print(error)
+            exit(1)
+
+        with ProcessPoolExecutor() as executor:
+            fingerprints = list(executor.map(compute_fingerprint, [key["public_key"] for key in keys], chunksize=64))
+
+        existing = self.client.describe_all_sshkeys()["results"]
+        existing_names = {key.get("name") for key in existing}
+        existing_fingerprints = {key.get("fingerprint"): key.get("name") for key in existing}
+
+        results = []
+        to_import = []
+        seen = {}
+        for key, fingerprint in zip(keys, fingerprints):
+            result = {"name": key["name"], "fingerprint": fingerprint, "source": key["source"]}
+            if fingerprint is None:
+                result["status"] = "invalid"
+            elif fingerprint in existing_fingerprints:
+                result["status"] = f"duplicate of {existing_fingerprints[fingerprint]}"
+            elif fingerprint in seen:
+                result["status"] = f"duplicate of {seen[fingerprint]}"
+            elif key["name"] in existing_names:
+                result["status"] = "name exists"
+            else:
+                seen[fingerprint] = key["name"]
+                result["status"] = "dry-run" if args.dry_run else "pending"
+                to_import.append((key, result))
+            results.append(result)
+
+        if not args.dry_run:
+            uploads = run_concurrently(
+                lambda item: self.client.import_sshkey(item[0]["name"], item[0]["public_key"], Tags=args.Tags),
+                to_import
+            )
+            for (_, result), response, error in uploads:
+                if error is not None:
+                    result["status"] = f"error: {error}"
+                elif isinstance(response, dict) and response.get("success") == False:
+                    result["status"] = f"error: {response.get('details', '')}"
+                else:
+                    result["status"] = "imported"
+
+        self.print_table(results, ["Name", "Fingerprint", "Status", "Source"], ["name", "fingerprint", "status", "source"])
+
+        if any(r["status"].startswith("error") for r in results):
+            exit(1)
+        exit()
+
+
+    def export_keys(self):
+        parser = argparse.ArgumentParser(description='Export SSH public keys to a directory or an authorized_keys file', prog=f"{APP_NAME} {self.parent_service} export-keys")
+        parser.add_argument('path',  help='Destination directory or file', metavar="<path>")
+        parser.add_argument('--authorized-keys', help='Write all keys into a single authorized_keys style file instead of one .pub file per key.', action='store_true')
+        args = parser.parse_args(sys.argv[3:])
+
+        keys = self.client.describe_all_sshkeys()["results"]
+        keys = [key for key in keys if key.get("public_key")]
+
+        try:
+            if args.authorized_keys:
+                lines = [f"{key['public_key'].strip()} {key['name']}" for key in keys]
+                write_file_atomic(args.path, "\n".join(lines) + "\n", 0o600)
+            else:
+                os.makedirs(args.path, exist_ok=True)
+                for key in keys:
+                    write_file_atomic(os.path.join(args.path, f"{key['name']}.pub"), key["public_key"].strip() + "\n", 0o600)
+        except OSError as error:
+            print(error)
+            exit(1)
+
+        print(f"Exported {len(keys)} keys to {args.path}")
+        exit()
+
+
+    @staticmethod
+    def _read_public_keys(path:str):
+        """
+        Read public keys from a directory of .pub files or from an authorized_keys style file.
+
+        Keys from a directory are named after their file. Keys from a single file are named
+        after their comment, falling back to the file name and line number.
+        """
+        keys = []
+        if os.path.isdir(path):
+            for file_name in sorted(os.listdir(path)):
+                if not file_name.endswith(".pub"):
+                    continue
+                file_path = os.path.join(path, file_name)
+                with open(file_path) as file_object:
+                    keys.append({"name": file_name[:-len(".pub")], "public_key": file_object.read().strip(), "source": file_path})
+            return keys
+
+        base_name = os.path.splitext(os.path.basename(path))[0]
+        with open(path) as file_object:
+            for line_number, line in enumerate(file_object, 1):
+                parsed = parse_public_key(line)
+                if parsed is None:
+                    continue
+                key_type, key_data, comment = parsed
+                name = comment.split()[0] if comment else f"{base_name}-{line_number}"
+                keys.append({"name": name, "public_key": f"{key_type} {key_data}", "source": f"{path}:{line_number}"})
+        return keys
@@ -1,10 +1,16 @@
+import os
 import sys
 import argparse
 import json
-from echome import Session
+import requests
 from echome.kube import Kube
-from .base_service import BaseService
+from echome.exceptions import ResourceDoesNotExistError, UnauthorizedResponse, UnexpectedResponseError, UnrecoverableError
+from .base_service import BaseService, get_session
 from .defaults import APP_NAME
+from .utils import write_file_atomic, run_concurrently, backoff
+
+CLUSTER_READY_STATES = ["ready"]
+CLUSTER_FAILED_STATES = ["failed", "terminating", "terminated", "deleted"]
 
 class KubeService(BaseService):
 
@@ -17,7 +23,7 @@ class KubeService(BaseService):
         self.table_headers = ["Cluster ID",  "Controller", "Associated Instances", "Status", "Created"]
         self.data_columns=["cluster_id", "primary", ["associated_instances", "instance_id"], "status", "created"]
 
-        self.session = Session()
+        self.session = get_session()
         self.client:Kube = self.session.client("Kube")
 
         self.parent_service_argparse()
@@ -30,10 +36,10 @@ class KubeService(BaseService):
         args = parser.parse_args(sys.argv[3:])
 
         clusters = self.client.describe_cluster(args.cluster_id)
-        if args.output == "table":
-            self.print_table(clusters["results"])
-        elif args.output == "json":
+        if args.output == "json":
             print(json.dumps(clusters, indent=4))
+        else:
+            self.print_output(clusters["results"], args.output)
         
         #TODO: Return exit value if command does not work
         exit()
@@ -45,10 +51,10 @@ class KubeService(BaseService):
         args = parser.parse_args(sys.argv[3:])
 
         clusters = self.client.describe_all_clusters()
-        if args.output == "table":
-            self.print_table(clusters["results"])
-        elif args.output == "json":
+        if args.output == "json":
             print(json.dumps(clusters, indent=4))
+        else:
+            self.print_output(clusters["results"], args.output)
         
         #TODO: Return exit value if command does not work
         exit()
@@ -96,7 +102,7 @@ class KubeService(BaseService):
     
 
     def create(self):
-        parser = argparse.ArgumentParser(description='Create a Kubernetes cluster', prog=f"{APP_NAME} {self.parent_service} describe-all")
+        parser = argparse.ArgumentParser(description='Create a Kubernetes cluster', prog=f"{APP_NAME} {self.parent_service} create")
         parser.add_argument('--image-id', help='Image Id', required=True, metavar="<value>", dest="ImageId")
         parser.add_argument('--instance-type', help='Instance Size', required=True, metavar="<value>", dest="InstanceType")
         parser.add_argument('--network-profile', help='Network type', required=True, metavar="<value>", dest="NetworkProfile")
@@ -104,9 +110,225 @@ class KubeService(BaseService):
         parser.add_argument('--key-name', help='Key name', metavar="<value>", dest="KeyName")
         parser.add_argument('--disk-size', help='Disk size', metavar="<value>", dest="DiskSize")
         parser.add_argument('--tags', help='Tags', type=json.loads, metavar='{"Key": "Value", "Key": "Value"}', dest="Tags")
+        parser.add_argument('--wait', help='Wait for the cluster to finish provisioning and print progress as it happens.', action='store_true')
+        parser.add_argument('--kubeconfig', help='With --wait, write the admin config file here as soon as it is available.', metavar="<./cluster.conf>")
+        parser.add_argument('--timeout', help='With --wait, seconds to wait before giving up.', type=int, default=1800, metavar="<seconds>")
         args = parser.parse_args(sys.argv[3:])
 
-        print(self.client.create_cluster(**vars(args)))
-        
-        #TODO: Return exit value if command does not work
+        items = vars(args)
+        wait = items.pop("wait")
+        kubeconfig = items.pop("kubeconfig")
+        timeout = items.pop("timeout")
+
+        # Check the destination now rather than after the cluster has been created
+        if kubeconfig:
+            directory = os.path.dirname(os.path.abspath(kubeconfig))
+            if not os.path.isdir(directory) or not os.access(directory, os.W_OK):
+                print(f"Unable to write the Kubernetes config to {kubeconfig}: {directory} is not a writable directory.")
+                exit(1)
+
+        response = self.client.create_cluster(**items)
+        if not wait:
+            print(response)
+            exit()
+
+        cluster_id = self._get_cluster_id(response)
+        if cluster_id is None:
+            print(response)
+            exit(1)
+
+        self._print_event(0, f"Cluster {cluster_id} submitted")
+        success = self._watch_cluster(cluster_id, kubeconfig=kubeconfig, timeout=timeout)
+        exit(0 if success else 1)
+
+
+    def add_nodes(self):
+        parser = argparse.ArgumentParser(description='Add worker nodes to a Kubernetes cluster', prog=f"{APP_NAME} {self.parent_service} add-nodes")
+        parser.add_argument('cluster_id',  help='Cluster Id', metavar="<cluster-id>")
+        parser.add_argument('--image-id', help='Image Id', required=True, metavar="<value>", dest="ImageId")
+        parser.add_argument('--instance-type', help='Instance Size', required=True, metavar="<value>", dest="InstanceType")
+        parser.add_argument('--network-profile', help='Network type', required=True, metavar="<value>", dest="NetworkProfile")
+        parser.add_argument('--key-name', help='Key name', metavar="<value>", dest="KeyName")
+        parser.add_argument('--disk-size', help='Disk size', metavar="<value>", dest="DiskSize")
+        parser.add_argument('--tags', help='Tags', type=json.loads, metavar='{"Key": "Value", "Key": "Value"}', dest="Tags")
+
+        group = parser.add_mutually_exclusive_group(required=True)
+        group.add_argument('--count', help='Number of worker nodes to add.', type=int, metavar="<value>")
+        group.add_argument('--node-ips', help='Private IP addresses for the new worker nodes, one node is added per IP.', nargs="+", metavar="<value>", dest="NodeIps")
+
+        parser.add_argument('--wait', help='Wait until all the new workers have joined the cluster.', action='store_true')
+        parser.add_argument('--timeout', help='With --wait, seconds to wait before giving up.', type=int, default=1800, metavar="<seconds>")
+        args = parser.parse_args(sys.argv[3:])
+
+        items = vars(args)
+        cluster_id = items.pop("cluster_id")
+        wait = items.pop("wait")
+        timeout = items.pop("timeout")
+        count = items.pop("count")
+        node_ips = items.pop("NodeIps")
+
+        if node_ips:
+            nodes = [dict(items, NodeIp=ip) for ip in node_ips]
+        else:
+            nodes = [dict(items) for _ in range(count)]
+
+        existing_workers = None
+        if wait:
+            cluster = self._describe_cluster(cluster_id)
+            if cluster is None:
+                print(f"Unable to describe cluster {cluster_id}.")
+                exit(1)
+            existing_workers = len(self._get_workers(cluster))
+
+        results = run_concurrently(lambda node: self.client.add_node(cluster_id, **node), nodes)
+
+        failed = False
+        output = []
+        for _, response, error in results:
+            if error is not None:
+                failed = True
+                output.append({"success": False, "details": str(error)})
+            else:
+                if isinstance(response, dict) and response.get("success") == False:
+                    failed = True
+                output.append(response)
+        print(json.dumps(output, indent=4))
+
+        if failed:
+            exit(1)
+
+        if wait:
+            success = self._watch_cluster(cluster_id, expected_workers=existing_workers + len(nodes), timeout=timeout)
+            exit(0 if success else 1)
+
         exit()
+
+
+    def _watch_cluster(self, cluster_id:str, kubeconfig:str = None, expected_workers:int = None, timeout:int = None):
+        """
+        Poll a cluster until it is ready, printing a progress event each time a provisioning phase changes.
+
+        If kubeconfig is set, the admin config is written to that path as soon as the server returns it.
+        If expected_workers is set, the cluster is not considered done until that many workers have joined.
+        Returns True on success, False if the cluster failed, the config could not be written or the timeout was reached.
+        """
+        controller_up = False
+        config_written = kubeconfig is None
+        config_failed = False
+        workers_seen = 0
+        last_status = None
+
+        for elapsed in backoff(initial=2.0, maximum=15.0, timeout=timeout):
+            cluster = self._describe_cluster(cluster_id)
+            if cluster is None:
+                continue
+
+            status = str(cluster.get("status", ""))
+            if status != last_status:
+                self._print_event(elapsed, f"Cluster status: {status}")
+                last_status = status
+
+            if not controller_up and cluster.get("primary"):
+                controller_up = True
+                self._print_event(elapsed, f"Controller up: {cluster['primary']}")
+
+            workers = self._get_workers(cluster)
+            if len(workers) > workers_seen:
+                for worker in workers[workers_seen:]:
+                    self._print_event(elapsed, f"Worker joined: {worker}")
+                workers_seen = len(workers)
+
+            if not config_written and controller_up:
+                try:
+                    config_written = self._write_kube_config(cluster_id, kubeconfig)
+                except OSError as error:
+                    # Keep following the cluster, but report the command as failed at the end
+                    self._print_event(elapsed, f"Unable to write Kubernetes config to {kubeconfig}: {error}")
+                    config_written = True
+                    config_failed = True
+                if config_written and not config_failed:
+                    self._print_event(elapsed, f"Kubernetes config written to {kubeconfig}")
+
+            if status.lower() in CLUSTER_FAILED_STATES:
+                self._print_event(elapsed, f"Cluster {cluster_id} did not finish provisioning")
+                return False
+
+            workers_done = expected_workers is None or workers_seen >= expected_workers
+            if status.lower() in CLUSTER_READY_STATES and config_written and workers_done:
+                self._print_event(elapsed, f"Cluster {cluster_id} is ready")
+                return not config_failed
+
+        print(f"Timed out waiting for cluster {cluster_id}.")
+        return False
+
+
+    def _describe_cluster(self, cluster_id:str):
+        """
+        Return the cluster details, or None if the request failed in a way that is worth retrying.
+
+        A cluster that does not exist or a failed login ends the command instead of being retried.
+        """
+        try:
+            response = self.client.describe_cluster(cluster_id)
+        except ResourceDoesNotExistError:
+            print(f"Cluster {cluster_id} does not exist.")
+            exit(1)
+        except (UnauthorizedResponse, TypeError):
+            # echome-sdk raises a str, which surfaces as a TypeError, when logging in again after a 401 fails
+            print(f"Unable to describe cluster {cluster_id}: unable to authorize with the ecHome server.")
+            exit(1)
+        except UnboundLocalError:
+            # echome-sdk fails this way when a response is not JSON
+            print(f"Unable to describe cluster {cluster_id}: the server did not return JSON.")
+            exit(1)
+        except UnrecoverableError as error:
+            print(f"Unable to describe cluster {cluster_id}: {error}")
+            exit(1)
+        except (requests.RequestException, UnexpectedResponseError):
+            return None
+
+        try:
+            return response["results"][0]
+        except (KeyError, IndexError, TypeError):
+            return None
+
+
+    def _write_kube_config(self, cluster_id:str, path:str):
+        """
+        Fetch the admin config and atomically write it to path. Returns False if it is not available yet.
+
+        Raises OSError if the file cannot be written.
+        """
+        try:
+            kube_config = self.client.get_kube_config(cluster_id)['results']['admin.conf']
+        except Exception:
+            return False
+
+        write_file_atomic(path, kube_config, 0o600)
+        return True
+
+
+    @staticmethod
+    def _get_workers(cluster:dict):
+        """Return the instance ids of the non-controller instances in a cluster"""
+        workers = []
+        if not cluster.get("primary"):
+            return workers
+
+        for instance in cluster.get("associated_instances") or []:
+            if instance and instance.get("instance_id") != cluster.get("primary"):
+                workers.append(instance["instance_id"])
+        return workers
+
+
+    @staticmethod
+    def _get_cluster_id(response):
+        try:
+            return response["results"]["cluster_id"]
+        except (KeyError, TypeError):
+            return None
+
+
+    @staticmethod
+    def _print_event(elapsed:float, message:str):
+        print(f"[{elapsed:7.1f}s] {message}", flush=True)
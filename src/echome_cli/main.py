@@ -5,23 +5,33 @@ __author__ = 'Marcus Gutierrez'
 import sys
 import argparse
 import logging
-from .identity import IdentityService
-from .keys import KeysService
-from .kube import KubeService
-from .network import NetworkService
-from .vm import VmService
+from .registry import ServiceRegistry
+from .recording import start_recording, start_replay
 from .defaults import APP_NAME
 
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
-services = {
-    "vm": VmService,
-    "keys": KeysService,
-    "network": NetworkService,
-    "identity": IdentityService,
-    "kube": KubeService,
-}
+services = ServiceRegistry()
+
+
+def pop_global_option(flag:str, default=None):
+    """
+    Remove a global '--flag value' option from sys.argv and return its value.
+
+    Services parse their arguments by position, so global options are taken out
+    before the service and subcommand are read.
+    """
+    if flag not in sys.argv:
+        return default
+    i = sys.argv.index(flag)
+    if i + 1 >= len(sys.argv):
+        print(f"{flag} requires a value")
+        exit(1)
+    value = sys.argv[i + 1]
+    del sys.argv[i:i + 2]
+    return value
+
 
 class ecHomeCli:
     def __init__(self):
@@ -35,9 +45,39 @@ The most commonly used ecHome service commands are:
    network    Create and manage virtual networks.
    kube       Create and manage Kubernetes clusters.
    identity   Create and manage User accounts, tokens, and policies.
+   ops        Track long-running operations such as image creation.
+
+Global options:
+   --record <session.har>   Save every request and response made by the command to a HAR file. Credentials and secrets are redacted.
+   --replay <session.har>   Answer requests from a HAR file instead of the ecHome server.
+   --replay-speed <value>   Divide recorded response times by this value when replaying. 0 disables delays.
 ''')
         parser.add_argument('service', help='Service to interact with')
 
+        record = pop_global_option("--record")
+        replay = pop_global_option("--replay")
+        replay_speed = pop_global_option("--replay-speed", "1")
+        if record and replay:
+            print("--record and --replay cannot be used together")
+            exit(1)
+        if record:
+            start_recording(record)
+        elif replay:
+            try:
+                speed = float(replay_speed)
+            except ValueError:
+                speed = None
+            # 'not >=' also rejects nan
+            if speed is None or not speed >= 0:
+                print(f"--replay-speed must be a number of 0 or more, got {replay_speed}")
+                exit(1)
+
+            try:
+                start_replay(replay, speed)
+            except (OSError, ValueError, KeyError) as error:
+                print(f"Unable to load recording {replay}: {error}")
+                exit(1)
+
         # parse_args defaults to [1:] for args, but you need to
         # exclude the rest of the args too, or validation will fail
         args = parser.parse_args(sys.argv[1:2])
@@ -46,12 +86,14 @@ The most commonly used ecHome service commands are:
             print(__version__)
             exit()
 
-        if args.service not in services.keys():
+        if args.service not in services:
             print('Unrecognized service')
             parser.print_help()
+            if services.plugins:
+                print(f"Installed plugin services: {', '.join(services.plugins)}")
             exit(1)
 
-        services[args.service]()
+        services.load(args.service)()
 
 
 if __name__ == "__main__":
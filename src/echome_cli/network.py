@@ -1,26 +1,45 @@
 import sys
 import argparse
-import json
-from echome import Session
 from echome.network import Network
-from .base_service import BaseService
+from echome.vm import Vm
+from .base_service import BaseService, get_session
 from .defaults import APP_NAME
+from .network_index import NetworkIndex
+from .records import Computed
 
 class NetworkService(BaseService):
 
     description = "Create and manage virtual networks."
 
+    exclusions = [
+        "print_usage_table"
+    ]
+
+    usage_table_headers = ["Name", "Network Id", "CIDR", "Used", "Free", "Fragmentation", "Next Free"]
+    usage_data_columns = [
+        "name", "network_id", "cidr", "used", "free", "fragmentation", 
+        Computed(lambda next_free: ",".join(next_free), "next_free")
+    ]
+
     def __init__(self):
         self.parent_service = "network"
         self.parent_full_name = "Network"
 
         self.table_headers = ["Name", "Network Id", "Type", "CIDR"]
-        self.data_columns=["name", "network_id", "type", "cidr"]
+        self.data_columns=[
+            "name", 
+            "network_id", 
+            "type", 
+            Computed(lambda network, prefix: f"{network}/{prefix}" if network else "", ["config", "network"], ["config", "prefix"])
+        ]
 
         self.extra_table_headers = ["Interface", "DNS Servers"] 
-        self.extra_data_columns = [["config", "bridge_interface"], ["config", "dns_servers"]]
+        self.extra_data_columns = [
+            ["config", "bridge_interface"], 
+            Computed(lambda servers: ",".join(servers) if servers else "", ["config", "dns_servers"])
+        ]
 
-        self.session = Session()
+        self.session = get_session()
         self.client:Network = self.session.client("Network")
 
         self.parent_service_argparse()
@@ -34,16 +53,7 @@ class NetworkService(BaseService):
         args = parser.parse_args(sys.argv[3:])
 
         networks = self.client.describe_network(args.network_id)
-        networks = networks['results']
-        if args.output == "table":
-            i=0
-            for network in networks:
-                networks[i]["cidr"] = f"{network['config']['network']}/{network['config']['prefix']}"
-                networks[i]["dns_servers"] = ",".join(network['config']['dns_servers'])
-                i += 1
-            self.print_table(networks, wide=args.wide)
-        elif args.output == "json":
-            print(json.dumps(networks, indent=4))
+        self.print_output(networks['results'], args.output, wide=args.wide)
         
         #TODO: Return exit value if command does not work
         exit()
@@ -52,25 +62,44 @@ class NetworkService(BaseService):
     def describe_all(self):
         parser = argparse.ArgumentParser(description='Describe all virtual networks', prog=f"{APP_NAME} {self.parent_service} describe-all")
         parser.add_argument(*self.output_flag_args, **self.output_flag_kwargs)
-        parser.add_argument('--wide', '-w', help='More descriptive output when in Table view', action='store_true', default=False)
+        parser.add_argument(*self.wide_flag_args, **self.wide_flags_kwargs)
         args = parser.parse_args(sys.argv[3:])
 
-        networks = self.client.describe_all_networks()
-        networks = networks['results']
-        i=0
-        for network in networks:
-            networks[i]["cidr"] = f"{network['config']['network']}/{network['config']['prefix']}"
-            i += 1
-        # if args.output == "table":
-        #     i=0
-        #     for network in networks:
-        #         networks[i]["cidr"] = f"{network['config']['network']}/{network['config']['prefix']}"
-        #         i += 1
-        #     self.print_table(networks, wide=args.wide)
-        # elif args.output == "json":
-        #     print(json.dumps(networks, indent=4))
+        networks = self.client.describe_all_networks()['results']
+        if args.output == "table":
+            networks = self.to_records(networks, wide=args.wide)
+        else:
+            # Copies, so the cidr key scripts rely on is added without changing the API results
+            networks = [dict(network, cidr=self._get_cidr(network)) for network in networks]
 
         self.print_output(networks, args.output, wide=args.wide)
         
         #TODO: Return exit value if command does not work
         exit()
+    
+
+    def usage_report(self):
+        parser = argparse.ArgumentParser(description='Show address usage for all virtual networks', prog=f"{APP_NAME} {self.parent_service} usage-report")
+        parser.add_argument(*self.output_flag_args, **self.output_flag_kwargs)
+        parser.add_argument('--next-free', help='Number of next free IP addresses to show per network', type=int, default=3, metavar="<value>")
+        args = parser.parse_args(sys.argv[3:])
+
+        networks = self.client.describe_all_networks()["results"]
+        vm_client:Vm = self.session.client("Vm")
+        vms = vm_client.describe_all_vms()["results"]
+
+        index = NetworkIndex(networks, vms)
+        report = [network.summary(args.next_free) for network in index.networks]
+        self.print_output(report, args.output, self.print_usage_table, header=self.usage_table_headers, data_columns=self.usage_data_columns)
+
+        exit()
+
+
+    def print_usage_table(self, report, wide:bool = False):
+        self.print_table(report, self.usage_table_headers, self.usage_data_columns)
+
+
+    @staticmethod
+    def _get_cidr(network:dict):
+        config = network.get("config") or {}
+        return f"{config.get('network')}/{config.get('prefix')}" if config.get("network") else ""
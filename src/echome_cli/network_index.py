@@ -0,0 +1,157 @@
+import bisect
+import ipaddress
+
+
+class NetworkAllocation:
+    """
+    Address allocation for a single virtual network.
+
+    Used addresses are kept as a sorted list of offsets from the network address,
+    so memory grows with the number of allocated addresses and not with the size
+    of the network. Free ranges are derived from the gaps between them.
+    """
+
+    def __init__(self, network:dict):
+        self.name = network.get("name", "")
+        self.network_id = network.get("network_id", "")
+        config = network.get("config") or {}
+        self.cidr = ipaddress.ip_network(f"{config['network']}/{config['prefix']}", strict=False)
+
+        # Usable host offsets, excluding network and broadcast addresses where they exist
+        if self.cidr.num_addresses > 2:
+            self.first, self.last = 1, self.cidr.num_addresses - 2
+        else:
+            self.first, self.last = 0, self.cidr.num_addresses - 1
+
+        self._used = []
+        gateway = config.get("gateway")
+        if gateway:
+            self.mark_used(gateway)
+
+
+    def __contains__(self, address):
+        return ipaddress.ip_address(address) in self.cidr
+
+
+    @property
+    def size(self):
+        return self.last - self.first + 1
+
+
+    @property
+    def used(self):
+        return len(self._used)
+
+
+    @property
+    def free(self):
+        return self.size - self.used
+
+
+    def mark_used(self, address):
+        """Mark an address as allocated. Addresses outside the usable range are ignored."""
+        offset = int(ipaddress.ip_address(address)) - int(self.cidr.network_address)
+        if offset < self.first or offset > self.last:
+            return
+        i = bisect.bisect_left(self._used, offset)
+        if i == len(self._used) or self._used[i] != offset:
+            self._used.insert(i, offset)
+
+
+    def free_ranges(self):
+        """Yield (first_offset, last_offset) for each contiguous run of free addresses"""
+        start = self.first
+        for offset in self._used:
+            if offset > start:
+                yield start, offset - 1
+            start = offset + 1
+        if start <= self.last:
+            yield start, self.last
+
+
+    def fragmentation(self):
+        """
+        Return how fragmented the free space is, from 0.0 to 1.0.
+
+        0.0 means all free addresses are in one contiguous range.
+        """
+        if self.free == 0:
+            return 0.0
+        largest = max(last - first + 1 for first, last in self.free_ranges())
+        return 1 - largest / self.free
+
+
+    def next_free(self, count:int = 1):
+        """Return up to count of the lowest free addresses as strings"""
+        addresses = []
+        for first, last in self.free_ranges():
+            for offset in range(first, last + 1):
+                if len(addresses) >= count:
+                    return addresses
+                addresses.append(str(self.cidr.network_address + offset))
+        return addresses
+
+
+    def allocate(self):
+        """Reserve and return the lowest free address, or None if the network is full"""
+        addresses = self.next_free(1)
+        if not addresses:
+            return None
+        self.mark_used(addresses[0])
+        return addresses[0]
+
+
+    def summary(self, next_free_count:int = 3):
+        return {
+            "name": self.name,
+            "network_id": self.network_id,
+            "cidr": str(self.cidr),
+            "used": self.used,
+            "free": self.free,
+            "fragmentation": round(self.fragmentation(), 3),
+            "next_free": self.next_free(next_free_count),
+        }
+
+
+class NetworkIndex:
+    """Allocation index for all virtual networks, built from one network listing and one VM listing"""
+
+    def __init__(self, networks:list, vms:list):
+        self.networks = []
+        for network in networks:
+            try:
+                self.networks.append(NetworkAllocation(network))
+            except (KeyError, TypeError, ValueError):
+                # Networks without an address configuration have nothing to allocate
+                continue
+
+        for vm in vms:
+            address = self.get_vm_ip(vm)
+            if address is None:
+                continue
+            for allocation in self.networks:
+                if address in allocation:
+                    allocation.mark_used(address)
+
+
+    @staticmethod
+    def get_vm_ip(vm:dict):
+        """Return the private IP of a VM without its prefix, or None if it does not have one"""
+        try:
+            private_ip = vm["interfaces"]["config_at_launch"]["private_ip"]
+        except (KeyError, TypeError):
+            return None
+        if not private_ip:
+            return None
+        try:
+            return str(ipaddress.ip_interface(private_ip).ip)
+        except ValueError:
+            return None
+
+
+    def get(self, network:str):
+        """Find a network by name or network id"""
+        for allocation in self.networks:
+            if network in [allocation.name, allocation.network_id]:
+                return allocation
+        return None
@@ -0,0 +1,138 @@
+import os
+import json
+import time
+import uuid
+import logging
+from contextlib import contextmanager
+from pathlib import Path
+from .utils import write_file_atomic
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_JOURNAL_FILE = ".echome/operations.json"
+LOCK_TIMEOUT = 10
+# A lock file older than this was left behind by a process that did not exit cleanly
+STALE_LOCK_AGE = 60
+
+STATE_PENDING = "pending"
+STATE_COMPLETED = "completed"
+STATE_FAILED = "failed"
+
+
+class Operation:
+    """A long-running mutation submitted to the ecHome server"""
+    __slots__ = ("operation_id", "kind", "resource_id", "state", "started", "finished")
+
+    def __init__(self, operation_id:str, kind:str, resource_id:str, state:str = STATE_PENDING, started:float = None, finished:float = None):
+        self.operation_id = operation_id
+        self.kind = kind
+        self.resource_id = resource_id
+        self.state = state
+        self.started = started if started is not None else time.time()
+        self.finished = finished
+
+
+    @property
+    def duration(self):
+        """Seconds from submission until it finished, or until now if it is still pending"""
+        end = self.finished if self.finished is not None else time.time()
+        return end - self.started
+
+
+    def finish(self, state:str):
+        self.state = state
+        self.finished = time.time()
+
+
+    def to_dict(self):
+        return {slot: getattr(self, slot) for slot in self.__slots__}
+
+
+class OperationJournal:
+    """
+    Local record of submitted operations, stored as JSON in the user's .echome directory.
+
+    Several commands may use the journal at the same time, e.g. 'ops wait' while new
+    images are being created. Saving re-reads the file under a lock file and merges it
+    with the operations in memory, so entries written by other processes are kept.
+    The file is then rewritten atomically so an interrupted command does not leave a
+    truncated file behind.
+    """
+
+    def __init__(self, path:str = None):
+        self.path = path or os.getenv("ECHOME_OPERATIONS_FILE", f"{str(Path.home())}/{DEFAULT_JOURNAL_FILE}")
+        self.operations = self._read()
+
+
+    def record(self, kind:str, resource_id:str):
+        """Add a new pending operation and save the journal"""
+        operation = Operation(f"op-{uuid.uuid4().hex[:8]}", kind, resource_id)
+        self.operations.append(operation)
+        self.save()
+        return operation
+
+
+    def get(self, operation_id:str):
+        for operation in self.operations:
+            if operation.operation_id == operation_id:
+                return operation
+        return None
+
+
+    def pending(self):
+        return [op for op in self.operations if op.state == STATE_PENDING]
+
+
+    def save(self):
+        """Merge with the journal on disk and write it back"""
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with self._lock():
+            on_disk = {op.operation_id: op for op in self._read()}
+            for i, operation in enumerate(self.operations):
+                stored = on_disk.pop(operation.operation_id, None)
+                # Another process may have seen this operation finish first
+                if stored is not None and operation.state == STATE_PENDING and stored.state != STATE_PENDING:
+                    self.operations[i] = stored
+            self.operations.extend(on_disk.values())
+            self.operations.sort(key=lambda op: op.started)
+
+            write_file_atomic(self.path, json.dumps([op.to_dict() for op in self.operations], indent=4))
+
+
+    def _read(self):
+        """Read the operations from disk. A missing or unreadable journal is treated as empty."""
+        try:
+            with open(self.path) as file_object:
+                return [Operation(**op) for op in json.load(file_object)]
+        except FileNotFoundError:
+            return []
+        except (ValueError, TypeError) as error:
+            logger.warning(f"Ignoring unreadable operations journal {self.path}: {error}")
+            return []
+
+
+    @contextmanager
+    def _lock(self):
+        """Hold an exclusive lock file next to the journal"""
+        lock_path = f"{self.path}.lock"
+        deadline = time.monotonic() + LOCK_TIMEOUT
+        while True:
+            try:
+                fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                break
+            except FileExistsError:
+                try:
+                    if time.time() - os.path.getmtime(lock_path) > STALE_LOCK_AGE:
+                        os.remove(lock_path)
+                        continue
+                except OSError:
+                    continue
+                if time.monotonic() > deadline:
+                    raise TimeoutError(f"Timed out waiting for the operations journal lock {lock_path}")
+                time.sleep(0.05)
+
+        try:
+            yield
+        finally:
+            os.close(fd)
+            os.remove(lock_path)
@@ -0,0 +1,116 @@
+import sys
+import argparse
+from datetime import datetime
+from echome.vm import Vm
+from .base_service import BaseService, get_session
+from .defaults import APP_NAME
+from .operations import OperationJournal, STATE_PENDING, STATE_COMPLETED, STATE_FAILED
+from .records import Computed
+from .utils import run_concurrently, backoff
+
+# Client method listing the resources for each kind of operation, and the resource states that end it.
+# Each listing is requested once per round for all pending operations of that kind.
+OPERATION_POLLERS = {
+    "create-vm-image": "describe_all_user_images",
+    "register-guest-image": "describe_all_guest_images",
+}
+READY_STATES = ["available", "ready"]
+FAILED_STATES = ["failed", "error"]
+
+
+class OpsService(BaseService):
+
+    description = "Track long-running operations such as image creation."
+
+    def __init__(self):
+        self.parent_service = "ops"
+        self.parent_full_name = "Operations"
+
+        self.table_headers = ["Operation Id", "Type", "Resource", "State", "Started", "Duration"]
+        self.data_columns = [
+            "operation_id",
+            "kind",
+            "resource_id",
+            "state",
+            Computed(lambda started: datetime.fromtimestamp(started).strftime("%Y-%m-%d %H:%M:%S"), "started"),
+            Computed(lambda duration: f"{duration:.1f}s", "duration"),
+        ]
+
+        self.journal = OperationJournal()
+
+        self.parent_service_argparse()
+
+
+    def list(self):
+        parser = argparse.ArgumentParser(description='List tracked operations', prog=f"{APP_NAME} {self.parent_service} list")
+        parser.add_argument(*self.output_flag_args, **self.output_flag_kwargs)
+        parser.add_argument('--pending', help='Only show operations that have not finished.', action='store_true')
+        args = parser.parse_args(sys.argv[3:])
+
+        operations = self.journal.pending() if args.pending else self.journal.operations
+        self.print_output([dict(op.to_dict(), duration=op.duration) for op in operations], args.output)
+
+        exit()
+
+
+    def wait(self):
+        parser = argparse.ArgumentParser(description='Wait for pending operations to finish', prog=f"{APP_NAME} {self.parent_service} wait")
+        parser.add_argument('operation_ids',  help='Operation Ids to wait for. Waits for all pending operations if none are given.', nargs="*", metavar="<operation-id>")
+        parser.add_argument('--timeout', help='Seconds to wait before giving up.', type=int, default=3600, metavar="<seconds>")
+        parser.add_argument(*self.output_flag_args, **self.output_flag_kwargs)
+        args = parser.parse_args(sys.argv[3:])
+
+        if args.operation_ids:
+            operations = []
+            for operation_id in args.operation_ids:
+                operation = self.journal.get(operation_id)
+                if operation is None:
+                    print(f"Unknown operation: {operation_id}")
+                    exit(1)
+                operations.append(operation)
+        else:
+            operations = self.journal.pending()
+
+        # Only waiting needs the server, so 'ops list' works without one configured
+        self.session = get_session()
+        self.client:Vm = self.session.client("Vm")
+
+        for _ in backoff(initial=2.0, maximum=30.0, timeout=args.timeout):
+            pending = [op for op in operations if op.state == STATE_PENDING]
+            if not pending:
+                break
+
+            kinds = sorted({op.kind for op in pending if op.kind in OPERATION_POLLERS})
+            states = {}
+            for kind, kind_states, error in run_concurrently(self._get_resource_states, kinds):
+                if error is None:
+                    states[kind] = kind_states
+
+            for operation in pending:
+                if operation.kind not in states:
+                    continue
+                state = states[operation.kind].get(operation.resource_id)
+                if state is None:
+                    # The resource was deleted or never created, so it will not become ready
+                    operation.finish(STATE_FAILED)
+                elif state.lower() in READY_STATES:
+                    operation.finish(STATE_COMPLETED)
+                elif state.lower() in FAILED_STATES:
+                    operation.finish(STATE_FAILED)
+                else:
+                    continue
+                print(f"{operation.operation_id} ({operation.kind} {operation.resource_id}) {operation.state} after {operation.duration:.1f}s", flush=True)
+
+            self.journal.save()
+
+        self.print_output([dict(op.to_dict(), duration=op.duration) for op in operations], args.output)
+
+        if any(op.state != STATE_COMPLETED for op in operations):
+            exit(1)
+        exit()
+
+
+    def _get_resource_states(self, kind:str):
+        """Return the current state of every resource of the type an operation kind creates, by resource id"""
+        results = getattr(self.client, OPERATION_POLLERS[kind])()["results"]
+        return {resource["image_id"]: str(resource.get("state", "")) for resource in results}
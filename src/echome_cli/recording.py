@@ -0,0 +1,246 @@
+import io
+import json
+import time
+import atexit
+import logging
+import threading
+from datetime import datetime, timezone
+from urllib.parse import urlsplit, parse_qsl, urlencode
+import requests
+import requests.sessions
+from requests.adapters import BaseAdapter, HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from .utils import write_file_atomic
+
+logger = logging.getLogger(__name__)
+
+REDACTED = "REDACTED"
+REDACTED_HEADERS = ["authorization"]
+REDACTED_FIELDS = ["password", "secret_key", "refresh", "access"]
+# Secrets the server returns in JSON response bodies, such as new SSH private keys and kube admin configs
+REDACTED_RESPONSE_FIELDS = REDACTED_FIELDS + ["PrivateKey", "admin.conf"]
+# Login and token refresh calls are not recorded, so a replay never writes session tokens to disk
+SKIPPED_PATHS = ["/identity/token"]
+
+_replaying = False
+
+
+class ReplayError(Exception):
+    pass
+
+
+def is_replaying():
+    return _replaying
+
+
+def _request_key(method:str, url:str, body):
+    """Match requests by method, path, query and body, ignoring the server address"""
+    parts = urlsplit(url)
+    path = parts.path + (f"?{parts.query}" if parts.query else "")
+    return method.upper(), path, body or ""
+
+
+def _redact_body(body:str):
+    """
+    Redact secret fields in a form encoded request body.
+
+    Used both when recording and when matching requests during a replay, so a live
+    request finds the recorded entry whose body was redacted the same way.
+    """
+    if not body:
+        return body
+    fields = parse_qsl(body, keep_blank_values=True)
+    # The SDK sends both 'password' (login) and 'Password' (create_user)
+    if not any(name.lower() in REDACTED_FIELDS for name, _ in fields):
+        return body
+    return urlencode([(name, REDACTED if name.lower() in REDACTED_FIELDS else value) for name, value in fields])
+
+
+def _redact_json(value):
+    """Return value with every REDACTED_RESPONSE_FIELDS key replaced, and whether anything was replaced"""
+    redacted = False
+    if isinstance(value, dict):
+        result = {}
+        for name, item in value.items():
+            if name in REDACTED_RESPONSE_FIELDS:
+                result[name] = REDACTED
+                redacted = True
+            else:
+                result[name], changed = _redact_json(item)
+                redacted = redacted or changed
+        return result, redacted
+    if isinstance(value, list):
+        result = []
+        for item in value:
+            item, changed = _redact_json(item)
+            result.append(item)
+            redacted = redacted or changed
+        return result, redacted
+    return value, False
+
+
+def _redact_response(text:str):
+    """Redact secret fields in a JSON response body. Other bodies are returned unchanged."""
+    try:
+        parsed = json.loads(text)
+    except ValueError:
+        return text
+    parsed, redacted = _redact_json(parsed)
+    return json.dumps(parsed) if redacted else text
+
+
+class HarRecorder:
+    """Collects request and response pairs and writes them as a HAR 1.2 file"""
+
+    def __init__(self, path:str):
+        self.path = path
+        self.entries = []
+        self.lock = threading.Lock()
+
+
+    def add(self, request, response, started:float, elapsed:float):
+        body = request.body.decode("utf-8") if isinstance(request.body, bytes) else request.body
+        entry = {
+            "startedDateTime": datetime.fromtimestamp(started, timezone.utc).isoformat(),
+            "time": round(elapsed * 1000, 3),
+            "request": {
+                "method": request.method,
+                "url": request.url,
+                "httpVersion": "HTTP/1.1",
+                "headers": self._headers(request.headers),
+                "queryString": [{"name": name, "value": value} for name, value in parse_qsl(urlsplit(request.url).query)],
+                "headersSize": -1,
+                "bodySize": len(body or ""),
+            },
+            "response": {
+                "status": response.status_code,
+                "statusText": response.reason or "",
+                "httpVersion": "HTTP/1.1",
+                "headers": self._headers(response.headers),
+                "content": {
+                    "size": len(response.content),
+                    "mimeType": response.headers.get("Content-Type", ""),
+                    "text": _redact_response(response.content.decode(response.encoding or "utf-8", errors="replace")),
+                },
+                "redirectURL": "",
+                "headersSize": -1,
+                "bodySize": len(response.content),
+            },
+            "cache": {},
+            "timings": {"send": 0, "wait": round(elapsed * 1000, 3), "receive": 0},
+        }
+        if body:
+            entry["request"]["postData"] = {
+                "mimeType": request.headers.get("Content-Type", ""),
+                "text": _redact_body(body),
+            }
+
+        with self.lock:
+            self.entries.append(entry)
+
+
+    def save(self):
+        from .main import __version__
+
+        har = {
+            "log": {
+                "version": "1.2",
+                "creator": {"name": "echome-cli", "version": __version__},
+                "entries": self.entries,
+            }
+        }
+        write_file_atomic(self.path, json.dumps(har, indent=2))
+        logger.debug(f"Recorded {len(self.entries)} requests to {self.path}")
+
+
+    @staticmethod
+    def _headers(headers):
+        return [
+            {"name": name, "value": REDACTED if name.lower() in REDACTED_HEADERS else value}
+            for name, value in headers.items()
+        ]
+
+
+class RecordingAdapter(HTTPAdapter):
+    """HTTPAdapter that sends requests normally and adds each exchange to the active recorder"""
+    recorder:HarRecorder = None
+
+    def send(self, request, **kwargs):
+        started = time.time()
+        response = super().send(request, **kwargs)
+        # Reading the content here means streamed responses are fully received before they are returned
+        response.content
+        elapsed = time.time() - started
+
+        path = urlsplit(request.url).path
+        if response.status_code != 401 and not any(skipped in path for skipped in SKIPPED_PATHS):
+            self.recorder.add(request, response, started, elapsed)
+        return response
+
+
+class ReplayAdapter(BaseAdapter):
+    """
+    Serves responses from a HAR file instead of making network requests.
+
+    Each request is answered with the next recorded response for the same method, path, query
+    and body, repeating the last one once they run out so polling loops keep working.
+    Responses are delayed by their recorded time divided by speed; a speed of 0 disables the delay.
+    """
+    entries = None
+    speed:float = 1.0
+    lock = threading.Lock()
+
+    def send(self, request, **kwargs):
+        body = request.body.decode("utf-8") if isinstance(request.body, bytes) else request.body
+        key = _request_key(request.method, request.url, _redact_body(body))
+
+        with self.lock:
+            queue = self.entries.get(key)
+            if not queue:
+                raise ReplayError(f"No recorded response for {key[0]} {key[1]}")
+            entry = queue.pop(0) if len(queue) > 1 else queue[0]
+
+        if self.speed:
+            time.sleep(entry["time"] / 1000 / self.speed)
+
+        recorded = entry["response"]
+        response = requests.Response()
+        response.status_code = recorded["status"]
+        response.reason = recorded.get("statusText", "")
+        response.headers = CaseInsensitiveDict({header["name"]: header["value"] for header in recorded["headers"]})
+        response.headers.pop("Content-Encoding", None)
+        response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+        response.raw = io.BytesIO(recorded["content"].get("text", "").encode(response.encoding or "utf-8"))
+        response.url = request.url
+        response.request = request
+        return response
+
+
+    def close(self):
+        pass
+
+
+def start_recording(path:str):
+    """Record every request made through requests until the process exits"""
+    RecordingAdapter.recorder = HarRecorder(path)
+    requests.sessions.HTTPAdapter = RecordingAdapter
+    atexit.register(RecordingAdapter.recorder.save)
+
+
+def start_replay(path:str, speed:float = 1.0):
+    """Answer every request made through requests from a recorded HAR file"""
+    global _replaying
+
+    with open(path) as file_object:
+        har = json.load(file_object)
+
+    entries = {}
+    for entry in har["log"]["entries"]:
+        request = entry["request"]
+        body = request.get("postData", {}).get("text", "")
+        entries.setdefault(_request_key(request["method"], request["url"], body), []).append(entry)
+
+    ReplayAdapter.entries = entries
+    ReplayAdapter.speed = speed
+    requests.sessions.HTTPAdapter = ReplayAdapter
+    _replaying = True
@@ -0,0 +1,113 @@
+import operator
+from functools import reduce
+
+
+def get_from_dict(dict, mapList):
+    """Traverse a dictionary to get a nested value from a list """
+    return reduce(operator.getitem, mapList, dict)
+
+
+def get_from_nested_list(dictionary, keys):
+    items = []
+    for val in dictionary[keys[0]]:
+        if val:
+            items.append(val[keys[1]])
+
+    return ",".join(items)
+
+
+def get_column_value(row:dict, col):
+    """
+    Get the value of a single table column from an API result.
+
+    A string column is a top level key. A list column is a path into nested dictionaries,
+    or a [list_key, item_key] pair that joins item_key from each item in a list.
+    Missing nested values are returned as an empty string.
+    """
+    if not isinstance(col, list):
+        return row[col]
+
+    try:
+        return get_from_dict(row, col)
+    except TypeError:
+        try:
+            return get_from_nested_list(row, col)
+        except Exception:
+            return ""
+    except KeyError:
+        return ""
+
+
+class Computed:
+    """
+    A table column derived from one or more other columns.
+
+    func is called with the values of the source columns when the row is rendered,
+    so the derived value is never stored, e.g.
+    Computed(lambda network, prefix: f"{network}/{prefix}", ["config", "network"], ["config", "prefix"])
+    """
+    __slots__ = ("func", "sources")
+
+    def __init__(self, func, *sources):
+        self.func = func
+        self.sources = sources
+
+
+def get_row_values(row:dict, data_columns:list):
+    """Get the values of all table columns for a single API result, evaluating Computed columns"""
+    values = []
+    for spec in data_columns:
+        if isinstance(spec, Computed):
+            values.append(spec.func(*[get_column_value(row, source) for source in spec.sources]))
+        else:
+            values.append(get_column_value(row, spec))
+    return values
+
+
+class RecordTable:
+    """
+    Column oriented store of only the values needed to render a table.
+
+    Building a RecordTable from a list of API results copies references to the column
+    values out of the nested dictionaries. Once the caller drops the original results,
+    only those values stay in memory. Rows are produced one at a time while rendering
+    and Computed columns are evaluated at that point.
+    """
+    __slots__ = ("header", "specs", "columns", "length")
+
+    def __init__(self, objlist, header:list, data_columns:list):
+        self.header = header
+        self.specs = data_columns
+        self.columns = []
+        self.length = 0
+
+        for spec in data_columns:
+            if isinstance(spec, Computed):
+                self.columns.append(tuple([] for _ in spec.sources))
+            else:
+                self.columns.append([])
+
+        for row in objlist:
+            for spec, column in zip(self.specs, self.columns):
+                if isinstance(spec, Computed):
+                    for source, values in zip(spec.sources, column):
+                        values.append(get_column_value(row, source))
+                else:
+                    column.append(get_column_value(row, spec))
+            self.length += 1
+
+
+    def __len__(self):
+        return self.length
+
+
+    def __iter__(self):
+        for i in range(self.length):
+            yield [self._value(spec, column, i) for spec, column in zip(self.specs, self.columns)]
+
+
+    @staticmethod
+    def _value(spec, column, i:int):
+        if isinstance(spec, Computed):
+            return spec.func(*[values[i] for values in column])
+        return column[i]
@@ -0,0 +1,119 @@
+import os
+import sys
+import json
+import logging
+from importlib import import_module
+from pathlib import Path
+from .utils import write_file_atomic
+
+logger = logging.getLogger(__name__)
+
+ENTRY_POINT_GROUP = "echome_cli.services"
+DEFAULT_CACHE_FILE = ".echome/cache/services.json"
+
+# Built-in services as "module:class" so they are only imported when invoked
+BUILTIN_SERVICES = {
+    "vm": "echome_cli.vm:VmService",
+    "keys": "echome_cli.keys:KeysService",
+    "network": "echome_cli.network:NetworkService",
+    "identity": "echome_cli.identity:IdentityService",
+    "kube": "echome_cli.kube:KubeService",
+    "ops": "echome_cli.ops:OpsService",
+}
+
+
+class ServiceRegistry:
+    """
+    Maps service names to the classes that implement them.
+
+    Third-party packages add services by declaring an entry point in the
+    'echome_cli.services' group, e.g. in setup.py:
+
+        entry_points={"echome_cli.services": ["backup = echome_backup.cli:BackupService"]}
+
+    Entry points are read from the installed package metadata once and cached on disk.
+    The cache is reused until an entry on sys.path changes, which happens whenever a
+    package is installed or removed. Service modules are only imported by load().
+    """
+
+    def __init__(self, cache_path:str = None):
+        self.cache_path = cache_path or os.getenv("ECHOME_SERVICE_CACHE", f"{str(Path.home())}/{DEFAULT_CACHE_FILE}")
+        self._plugins = None
+
+
+    @property
+    def plugins(self):
+        """Services provided by installed packages, as a dict of name to 'module:class'"""
+        if self._plugins is None:
+            self._plugins = self._load_plugins()
+        return self._plugins
+
+
+    def names(self):
+        return list(BUILTIN_SERVICES) + [name for name in self.plugins if name not in BUILTIN_SERVICES]
+
+
+    def __contains__(self, name:str):
+        return name in BUILTIN_SERVICES or name in self.plugins
+
+
+    def load(self, name:str):
+        """Import and return the service class registered under name"""
+        target = BUILTIN_SERVICES.get(name) or self.plugins[name]
+        module_name, _, attr = target.partition(":")
+        return getattr(import_module(module_name), attr)
+
+
+    def _load_plugins(self):
+        key = self._cache_key()
+        try:
+            with open(self.cache_path) as file_object:
+                cache = json.load(file_object)
+            if cache.get("key") == key:
+                return cache["services"]
+        except (OSError, ValueError, KeyError):
+            pass
+
+        services = self._discover()
+        try:
+            os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+            write_file_atomic(self.cache_path, json.dumps({"key": key, "services": services}))
+        except OSError as error:
+            logger.debug(f"Unable to write service cache: {error}")
+        return services
+
+
+    @staticmethod
+    def _cache_key():
+        """Modification times of the sys.path entries. Installing or removing a package changes at least one."""
+        key = []
+        for path in sys.path:
+            if not path:
+                continue
+            try:
+                key.append([path, os.stat(path).st_mtime])
+            except OSError:
+                continue
+        return key
+
+
+    @staticmethod
+    def _discover():
+        """Read the service entry points from the installed package metadata"""
+        try:
+            from importlib.metadata import entry_points
+        except ImportError:
+            # Python < 3.8 has no importlib.metadata, setup.py installs the backport there instead
+            try:
+                from importlib_metadata import entry_points
+            except ImportError:
+                logger.warning("Plugin services are unavailable: install importlib-metadata to discover them.")
+                return {}
+
+        eps = entry_points()
+        if hasattr(eps, "select"):
+            eps = eps.select(group=ENTRY_POINT_GROUP)
+        else:
+            eps = eps.get(ENTRY_POINT_GROUP, [])
+
+        return {ep.name: ep.value for ep in eps}
@@ -0,0 +1,184 @@
+import copy
+import codecs
+import json
+import logging
+import requests
+from echome.exceptions import UnauthorizedResponse, UnexpectedResponseError, ResourceDoesNotExistError
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+WHITESPACE = " \t\n\r"
+NUMBER_CHARS = "0123456789.eE+-"
+
+
+class BadRequestError(Exception):
+    """The server rejected a streamed request with a 400 response. The message is the details it returned."""
+    pass
+
+
+class JsonArrayStream:
+    """
+    Incrementally decode the items of one array in a JSON object.
+
+    Reads text chunks and yields each item of the array stored under key in the
+    top level object as soon as it has been fully received. Other top level values
+    are decoded and discarded, so only one item and one chunk are held in memory at a time.
+    """
+
+    def __init__(self, chunks, key:str = "results"):
+        self.chunks = iter(chunks)
+        self.key = key
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+
+
+    def __iter__(self):
+        self._expect("{")
+        while True:
+            if self._peek() == "}":
+                return
+            name = self._decode()
+            self._expect(":")
+            if name == self.key and self._peek() == "[":
+                self._expect("[")
+                if self._peek() == "]":
+                    self.pos += 1
+                else:
+                    while True:
+                        yield self._decode()
+                        if self._peek() == "]":
+                            self.pos += 1
+                            break
+                        self._expect(",")
+            else:
+                self._decode()
+
+            if self._peek() == "}":
+                return
+            self._expect(",")
+
+
+    def _fill(self, min_size:int = 0):
+        """
+        Read chunks until the unread part of the buffer is at least min_size characters,
+        reading at least one chunk. Returns False if the input had already ended.
+        """
+        if self.eof:
+            return False
+
+        parts = [self.buffer[self.pos:]]
+        size = len(parts[0])
+        while True:
+            try:
+                chunk = next(self.chunks)
+            except StopIteration:
+                self.eof = True
+                break
+            parts.append(chunk)
+            size += len(chunk)
+            if size >= min_size:
+                break
+
+        # Drop everything already consumed and join the new chunks once
+        self.buffer = "".join(parts)
+        self.pos = 0
+        return len(parts) > 1 or not self.eof
+
+
+    def _peek(self):
+        """Skip whitespace and return the next character without consuming it"""
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._fill():
+                raise ValueError("Unexpected end of JSON response")
+
+
+    def _expect(self, char:str):
+        found = self._peek()
+        if found != char:
+            raise ValueError(f"Expected '{char}' in JSON response but found '{found}'")
+        self.pos += 1
+
+
+    def _decode(self):
+        """Decode the next complete JSON value, reading more chunks until it is available"""
+        self._peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+                # A number at the end of the buffer may continue in the next chunk
+                if self.eof or (end < len(self.buffer) and self.buffer[end] not in NUMBER_CHARS):
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            # Wait until the unread data has doubled before decoding again, so values
+            # larger than a chunk are decoded in linear rather than quadratic time
+            self._fill(2 * (len(self.buffer) - self.pos))
+
+
+def iter_text(byte_chunks, encoding:str = "utf-8"):
+    """Decode byte chunks to text without splitting multi-byte characters"""
+    decoder = codecs.getincrementaldecoder(encoding)()
+    for chunk in byte_chunks:
+        text = decoder.decode(chunk)
+        if text:
+            yield text
+    text = decoder.decode(b"", final=True)
+    if text:
+        yield text
+
+
+def sdk_path(client, method:str):
+    """Return the path an SDK client's listing method requests, without making the request"""
+    probe = copy.copy(client)
+    probe.get = lambda path, **kwargs: path
+    return getattr(probe, method)()
+
+
+def stream_results(client, method:str):
+    """
+    Make the GET request of an SDK client's listing method and return an iterator over the 'results' items.
+
+    The SDK reads and decodes the entire response before returning it. This makes the same
+    request with a streamed response instead, so large listings can be rendered while they
+    are still being received. Error responses are handled like the SDK does: 400 raises
+    BadRequestError with the server's details, 404 raises ResourceDoesNotExistError and a
+    failed login raises UnauthorizedResponse.
+    """
+    url = f"{client.base_url}{sdk_path(client, method)}"
+    for attempt in range(2):
+        response = requests.get(url, headers=client.session.build_headers(), stream=True)
+        logger.debug(f"Got response code: {response.status_code}")
+        if response.status_code != 401 or attempt:
+            break
+
+        response.close()
+        logger.debug("Access token has expired, attempting refresh")
+        try:
+            client.session.refresh_access_token()
+        except UnauthorizedResponse:
+            client.session.login()
+
+    if response.status_code == 400:
+        try:
+            details = response.json().get("details", "")
+        except (ValueError, AttributeError):
+            details = response.text
+        raise BadRequestError(details)
+    if response.status_code == 401:
+        raise UnauthorizedResponse("Unable to successfully authorize with ecHome server.")
+    if response.status_code == 404:
+        raise ResourceDoesNotExistError(response)
+    if response.status_code != 200:
+        raise UnexpectedResponseError(f"Got unexpected response from the server. Status code: {response.status_code}")
+
+    chunks = iter_text(response.iter_content(chunk_size=CHUNK_SIZE), response.encoding or "utf-8")
+    return iter(JsonArrayStream(chunks))
@@ -0,0 +1,76 @@
+import os
+import time
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_MAX_WORKERS = 8
+
+
+def write_file_atomic(path:str, contents:str, mode:int = None, overwrite:bool = True):
+    """
+    Write contents to path atomically.
+
+    The contents are written to a temporary file in the same directory and then
+    renamed over the destination, so readers never see a partially written file.
+    If mode is set, the permissions are applied before the file is moved into place.
+    If overwrite is False, FileExistsError is raised when path already exists, even if it
+    was created after this function was called.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "w") as file_object:
+            file_object.write(contents)
+            file_object.flush()
+            os.fsync(file_object.fileno())
+        if mode is not None:
+            os.chmod(tmp_path, mode)
+        if overwrite:
+            os.replace(tmp_path, path)
+        else:
+            # link() fails if the destination exists, unlike replace()
+            os.link(tmp_path, path)
+            os.remove(tmp_path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def run_concurrently(func, items, max_workers:int = DEFAULT_MAX_WORKERS):
+    """
+    Call func on every item using a thread pool.
+
+    Returns a list of (item, result, error) tuples in the same order as items.
+    Exceptions are captured per item instead of aborting the whole batch.
+    """
+    items = list(items)
+    if not items:
+        return []
+
+    def call(item):
+        try:
+            return item, func(item), None
+        except Exception as error:
+            return item, None, error
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(items))) as executor:
+        return list(executor.map(call, items))
+
+
+def backoff(initial:float = 1.0, maximum:float = 30.0, factor:float = 2.0, timeout:float = None):
+    """
+    Generator that sleeps with exponential backoff between iterations.
+
+    Yields the elapsed time in seconds before each attempt. The first attempt
+    is made immediately. Stops once timeout (in seconds) is exceeded.
+    """
+    start = time.monotonic()
+    delay = initial
+    while True:
+        elapsed = time.monotonic() - start
+        if timeout is not None and elapsed > timeout:
+            return
+        yield elapsed
+        time.sleep(delay)
+        delay = min(delay * factor, maximum)
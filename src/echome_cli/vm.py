@@ -1,11 +1,16 @@
 import sys
 import argparse
 import json
-from tabulate import tabulate
-from echome import Session
+import logging
 from echome.vm import Vm
-from .base_service import BaseService
+from echome.network import Network
+from .base_service import BaseService, get_session
 from .defaults import APP_NAME
+from .network_index import NetworkIndex
+from .records import Computed
+from .operations import OperationJournal
+
+logger = logging.getLogger(__name__)
 
 class VmService(BaseService):
 
@@ -16,11 +21,25 @@ class VmService(BaseService):
         "print_image_table"
     ]
 
+    vm_table_headers = ["Name", "Vm Id", "Instance Size", "State", "IP", "Image", "Created"]
+    vm_data_columns = [
+        Computed(lambda tags: tags.get("Name", "") if tags else "", "tags"),
+        "instance_id",
+        Computed(lambda instance_type, instance_size: f"{instance_type}.{instance_size}", "instance_type", "instance_size"),
+        ["state", "state"],
+        ["interfaces", "config_at_launch", "private_ip"],
+        Computed(lambda image_id, image_name: f"{image_id} ({image_name})" if image_id else "", ["image_metadata", "image_id"], ["image_metadata", "image_name"]),
+        "created",
+    ]
+
+    image_table_headers = ["Name", "Image Id", "Format", "State", "Description"]
+    image_data_columns = ["name", "image_id", ["metadata", "format"], "state", "description"]
+
     def __init__(self):
         self.parent_service = "vm"
         self.parent_full_name = "Virtual Machine"
         
-        self.session = Session()
+        self.session = get_session()
         self.client:Vm = self.session.client("Vm")
 
         self.parent_service_argparse()
@@ -31,8 +50,12 @@ class VmService(BaseService):
         parser.add_argument(*self.output_flag_args, **self.output_flag_kwargs)
         args = parser.parse_args(sys.argv[3:])
 
-        items = self.client.describe_all_vms()
-        self.print_output(items["results"], args.output, self.print_vm_table)
+        # Same request as self.client.describe_all_vms(), decoded one VM at a time
+        items = self.stream_results("describe_all_vms")
+        if args.output == "table":
+            items = self.to_records(items, self.vm_table_headers, self.vm_data_columns)
+
+        self.print_output(items, args.output, self.print_vm_table, header=self.vm_table_headers, data_columns=self.vm_data_columns)
 
         exit()
     
@@ -44,7 +67,7 @@ class VmService(BaseService):
         args = parser.parse_args(sys.argv[3:])
 
         vm = self.client.describe_vm(args.vm_id)
-        self.print_output(vm["results"], args.output, self.print_vm_table)
+        self.print_output(vm["results"], args.output, self.print_vm_table, header=self.vm_table_headers, data_columns=self.vm_data_columns)
         
         exit()
 
@@ -57,7 +80,7 @@ class VmService(BaseService):
         group.add_argument('--volume-id', help='Volume Id', metavar="<value>", dest="VolumeId")
         parser.add_argument('--instance-type', help='Instance Size', required=True, metavar="<value>", dest="InstanceType")
         parser.add_argument('--network-profile', help='Network type', required=True, metavar="<value>", dest="NetworkProfile")
-        parser.add_argument('--private-ip', help='Network private IP', metavar="<value>", dest="PrivateIp")
+        parser.add_argument('--private-ip', help='Network private IP. Use "auto" to pick the next free address in the network profile.', metavar="<value>", dest="PrivateIp")
         parser.add_argument('--key-name', help='Key name', metavar="<value>", dest="KeyName")
         parser.add_argument('--disk-size', help='Disk size', metavar="<value>", dest="DiskSize")
         parser.add_argument('--disk-image-id', help='Disk Image to mount to the virtual machine', metavar="<value>", dest="DiskImageId")
@@ -87,6 +110,9 @@ class VmService(BaseService):
             items["Tags"]["Name"] = items["Name"]
             items.pop("Name", None)
 
+        if items["PrivateIp"] == "auto":
+            items["PrivateIp"] = self._allocate_private_ip(items["NetworkProfile"])
+
         # ** unpacks the arguments, vars() returns the variables and provides them to client.create() as
         # ImageId=gmi-12345, InstanceSize=standard.small, etc.
         resp = self.client.create_vm(**items)
@@ -104,6 +130,7 @@ class VmService(BaseService):
         args = parser.parse_args(sys.argv[3:])
 
         resp = self.client.create_vm_image(**vars(args))
+        self._track_image_operation("create-vm-image", resp)
         self.print_output(resp, "json")
         #TODO: Return exit value if command does not work
         exit()
@@ -152,6 +179,7 @@ class VmService(BaseService):
         args = parser.parse_args(sys.argv[3:])
 
         resp = self.client.register_guest_image(**vars(args))
+        self._track_image_operation("register-guest-image", resp)
         self.print_output(resp, "json")
 
         #TODO: Return exit value if command does not work
@@ -165,7 +193,7 @@ class VmService(BaseService):
         args = parser.parse_args(sys.argv[3:])
 
         image = self.client.describe_guest_image(args.image_id)
-        self.print_output(image["results"], args.output, self.print_image_table)
+        self.print_output(image["results"], args.output, self.print_image_table, header=self.image_table_headers, data_columns=self.image_data_columns)
         
         #TODO: Return exit value if command does not work
         exit()
@@ -178,7 +206,7 @@ class VmService(BaseService):
         args = parser.parse_args(sys.argv[3:])
 
         image = self.client.describe_user_image(args.image_id)
-        self.print_output(image["results"], args.output, self.print_image_table)
+        self.print_output(image["results"], args.output, self.print_image_table, header=self.image_table_headers, data_columns=self.image_data_columns)
         
         #TODO: Return exit value if command does not work
         exit()
@@ -189,8 +217,12 @@ class VmService(BaseService):
         parser.add_argument(*self.output_flag_args, **self.output_flag_kwargs)
         args = parser.parse_args(sys.argv[3:])
 
-        images = self.client.describe_all_guest_images()
-        self.print_output(images["results"], args.output, self.print_image_table)
+        # Same request as self.client.describe_all_guest_images(), decoded one image at a time
+        images = self.stream_results("describe_all_guest_images")
+        if args.output == "table":
+            images = self.to_records(images, self.image_table_headers, self.image_data_columns)
+
+        self.print_output(images, args.output, self.print_image_table, header=self.image_table_headers, data_columns=self.image_data_columns)
         
         #TODO: Return exit value if command does not work
         exit()
@@ -201,36 +233,55 @@ class VmService(BaseService):
         parser.add_argument(*self.output_flag_args, **self.output_flag_kwargs)
         args = parser.parse_args(sys.argv[3:])
 
-        images = self.client.describe_all_user_images()
-        self.print_output(images["results"], args.output, self.print_image_table)
+        images = self.client.describe_all_user_images()["results"]
+        if args.output == "table":
+            images = self.to_records(images, self.image_table_headers, self.image_data_columns)
+
+        self.print_output(images, args.output, self.print_image_table, header=self.image_table_headers, data_columns=self.image_data_columns)
         
         #TODO: Return exit value if command does not work
         exit()
 
 
+    @staticmethod
+    def _track_image_operation(kind:str, response):
+        """Record a submitted image operation in the local journal so 'ops wait' can follow it"""
+        try:
+            image_id = response["results"]["image_id"]
+        except (KeyError, TypeError):
+            return
+
+        if response.get("success") == False or not image_id:
+            return
+
+        # The server has already accepted the request, so a local journal problem must not hide the response
+        try:
+            response["operation_id"] = OperationJournal().record(kind, image_id).operation_id
+        except (OSError, ValueError, TypeError) as error:
+            logger.warning(f"Unable to record {kind} operation for {image_id}: {error}")
+
+
+    def _allocate_private_ip(self, network_profile:str):
+        """Pick the next free address in a network from a single network and VM listing"""
+        network_client:Network = self.session.client("Network")
+        networks = network_client.describe_all_networks()["results"]
+        vms = self.client.describe_all_vms()["results"]
+
+        network = NetworkIndex(networks, vms).get(network_profile)
+        if network is None:
+            print(f"Unable to find network '{network_profile}' to allocate a private IP from.")
+            exit(1)
+
+        address = network.allocate()
+        if address is None:
+            print(f"No free addresses left in network '{network_profile}'.")
+            exit(1)
+        return address
+
+
     def print_vm_table(self, vm_list, wide:bool = False):
-        headers = ["Name", "Vm Id", "Instance Size", "State", "IP", "Image", "Created"]
-        all_vms = []
-        for vm in vm_list:
-            name = vm["tags"]["Name"] if "Name" in vm["tags"] else ""
-            isize = f"{vm['instance_type']}.{vm['instance_size']}"
-            if vm["interfaces"]:
-                ip = vm["interfaces"]["config_at_launch"]["private_ip"]
-            else:
-                ip = ""
-
-            if vm['image_metadata']:
-                image = "{} ({})".format(vm['image_metadata']['image_id'], vm['image_metadata']['image_name'])
-            else:
-                image = ""
-
-            v = [name, vm["instance_id"], isize, vm["state"]["state"], ip, image, vm["created"]]
-            all_vms.append(v)
-
-        print(tabulate(all_vms, headers))
+        self.print_table(vm_list, self.vm_table_headers, self.vm_data_columns)
     
 
     def print_image_table(self, img_list, wide:bool = False):
-        table_headers = ["Name", "Image Id", "Format", "State", "Description"]
-        data_columns=["name", "image_id", ["metadata", "format"], "state", "description"]
-        self.print_table(img_list, table_headers, data_columns)
+        self.print_table(img_list, self.image_table_headers, self.image_data_columns)